@@ -5,42 +5,66 @@ import pandas as pd
 import matplotlib.pyplot as plt
 from datetime import datetime
 import time
+import uuid
 from requests.exceptions import ConnectionError, Timeout
 # 导入自定义工具函数（需确保utils文件夹存在对应文件）
-from utils import feature_engineering, data_clean, predict_signal
+from utils import backtest, export, jobs, robustness, strategies
 
 plt.rcParams["font.family"] = ["SimHei", "WenQuanYi Micro Hei", "Heiti TC"]
 plt.rcParams["axes.unicode_minus"] = False  # 解决负号显示异常
 
-# 计算最大回撤（风险指标）
-def calculate_max_drawdown(return_series):
-    if len(return_series) < 2:
-        return 0.0
-    peak_series = return_series.cummax()  # 历史峰值
-    drawdown_series = (return_series - peak_series) / peak_series  # 每日回撤
-    return round(drawdown_series.min() * 100, 2)  # 最大回撤百分比
-
-
-# 计算策略胜率（盈利交易占比）
-def calculate_win_rate(signal_df):
-    signal_points = signal_df[signal_df["买卖信号"] != 0].copy()
-    if len(signal_points) < 2:
-        return 0.0
-
-    win_count = 0
-    total_trades = 0
-    buy_price = None
-
-    for _, row in signal_points.iterrows():
-        if row["买卖信号"] == 1:
-            buy_price = row["收盘"]
-        elif row["买卖信号"] == -1 and buy_price is not None:
-            total_trades += 1
-            if row["收盘"] > buy_price:
-                win_count += 1
-            buy_price = None
-
-    return round((win_count / total_trades) * 100, 2) if total_trades > 0 else 0.0
+# 蒙特卡洛分析按收益序列与参数缓存，页面其他交互触发重新运行时不会重复计算
+@st.cache_data(max_entries=8, show_spinner="蒙特卡洛模拟中...")
+def monte_carlo(returns, method, n_paths, block_size, periods_per_year):
+    return robustness.run_monte_carlo(returns, method=method, n_paths=n_paths, block_size=block_size,
+                                      periods_per_year=periods_per_year, seed=42)
+
+
+# 行情数据的内容指纹：作为任务键的一部分，重新获取的数据不会误用旧任务的结果
+def data_fingerprint(df):
+    return f"{pd.util.hash_pandas_object(df).sum():x}"
+
+
+# 后台任务运行中：定时刷新进度（仅刷新本片段，不会重启回测）
+@st.fragment(run_every=0.5)
+def poll_job(job_key):
+    job = jobs.get(job_key)
+    if job is None or job.finished or job.cancelled:
+        st.rerun()  # 任务结束后整页刷新以展示结果
+
+    st.progress(job.progress, text=f"🔧 {job.stage}" + (f"：{job.message}" if job.message else ""))
+    if st.button("⏹ 取消", key=f"cancel_{job_key}"):
+        job.cancel()
+
+
+# 展示后台回测任务状态，任务完成后收取结果
+def show_job_progress():
+    job = jobs.get(st.session_state.job_key)
+    if job is None:
+        st.session_state.job_key = None
+        return
+    if not job.finished and not job.cancelled:
+        poll_job(st.session_state.job_key)
+        return
+
+    if job.status == "done":
+        if not st.session_state.job_collected:
+            df_signal, result = job.result
+            st.session_state.df_signal = df_signal
+            st.session_state.df = df_signal
+            st.session_state.backtest_result = result
+            st.session_state.job_collected = True
+
+        st.success(f"✅ 回测完成！（耗时 {job.finished_at - job.created_at:.1f} 秒）")
+        with st.expander("查看回测数据样例（前5行）"):
+            st.dataframe(
+                st.session_state.df_signal[["日期", "股票代码", "收盘", "pred_signal", "仓位", "资金余额", "累计收益倍数"]].head(),
+                hide_index=True
+            )
+    elif job.status == "failed":
+        st.error(f"回测失败：{job.error}")
+    else:
+        st.warning("回测已取消")
 
 
 def show():
@@ -51,10 +75,14 @@ def show():
         "end_date": datetime.now(),
         "stock_df": None,  # 原始数据
         "date_col": "日期",
-        "feature_df": None,  # 特征工程数据
-        "df_clean": None,  # 清洗后数据
         "df": None,  # 最终回测数据（含信号+收益）
-        "backtest_result": None  # 回测指标
+        "df_signal": None,
+        "backtest_result": None,  # 回测指标
+        "initial_capital": 100000.0,
+        "job_key": None,  # 后台回测任务
+        "job_collected": False,
+        "compare_key": None,  # 多策略对比任务
+        "export_key": None  # 导出任务
     }
     for key, value in session_vars.items():
         if key not in st.session_state:
@@ -182,6 +210,13 @@ def show():
     # ---------------------- 5. 执行回测 ----------------------
     st.subheader("3. 执行回测（含收益分析）")
     with st.container(border=True):
+        initial_capital = st.text_input("初始资金：", "100000")  # 给个默认值
+        try:
+            st.session_state.initial_capital = float(initial_capital)
+        except ValueError:
+            st.error("请输入合法的数字作为初始资金")
+            st.stop()
+
         backtest_btn = st.button(
             "🚀 开始回测",
             type="primary",
@@ -190,155 +225,23 @@ def show():
         )
 
         if backtest_btn:
-            try:
-                # 步骤1：数据清洗
-                st.write("🔧 步骤1/4：数据清洗...")
-                df_clean = data_clean.clean1(st.session_state.stock_df)
-                st.session_state.df_clean = df_clean
-                if len(df_clean) < 30:
-                    st.error("数据不足30条，无法计算MACD")
-                    raise Exception("数据量不足")
-
-                # 步骤2：特征工程（计算MACD）
-                st.write("🔧 步骤2/4：计算MACD指标...")
-                feature_df = feature_engineering.feature_engineering(df_clean)
-                st.session_state.feature_df = feature_df
-
-                # 步骤3：二次清洗
-                st.write("🔧 步骤3/4：数据标准化...")
-                df = data_clean.clean2(feature_df)
-                st.session_state.df = df
-
-                # 验证必要列
-                required_cols = ["MACD", "MACD_Signal", "日期", "收盘"]
-                missing = [c for c in required_cols if c not in df.columns]
-                if missing:
-                    st.error(f"缺少必要列：{', '.join(missing)}")
-                    raise Exception("数据格式错误")
-
-                # 步骤4：计算信号与收益
-                current_file = os.path.abspath(__file__)
-                # 获取 utils 目录
-                utils_dir = os.path.dirname(current_file)
-                # 获取项目根目录（AKshare）
-                project_root = os.path.dirname(utils_dir)
-                # 构建模型路径
-                model_paths = {
-                    "static": os.path.join(project_root, "model", "model1_static_lgb.pkl"),
-                    "time": os.path.join(project_root, "model", "model2_time_lgb.pkl"),
-                    "meta": os.path.join(project_root, "model", "meta_model_logistic.pkl")
-                }
-
-                models = predict_signal.load_models(model_paths)
-                # print(st.session_state.df.columns)
-                static_features = ['开盘', '收盘', '最高', '最低', '成交量', '换手率',
-                                   'MA_5', 'MA_20', 'MACD', 'MACD_Signal', 'RSI_14',
-                                   'Volatility_20D', 'BB_Middle', 'ATR_14', 'OBV']
-
-                time_features = ['收盘_5d_mean', '成交量_5d_mean', 'MACD_5d_mean', 'RSI_14_5d_mean',
-                                 '最高_5d_max', '最低_5d_min', '股票代码']
-
-                # st.dataframe(st.session_state.df.head(10), hide_index=True)
-
-                df_signal = predict_signal.predict_signal(st.session_state.df, static_features, time_features, models["static"], models["time"], models["meta"])
-                st.session_state.df_signal = df_signal
-
-                # st.dataframe(st.session_state.df_signal.head(10), hide_index=True)
-
-            except Exception as e:
-                st.error(f"回测失败：{str(e)}")
-
-            st.write("🔧 步骤4/4：执行回测与收益计算...")
-            initial_capital = st.text_input("初始资金：", "100000")  # 给个默认值
-            try:
-                st.session_state.initial_capital = float(initial_capital)
-            except ValueError:
-                st.error("请输入合法的数字作为初始资金")
-                st.stop()
-
-            # 初始化回测列
-            st.session_state.df_signal["买卖信号"] = st.session_state.df_signal["pred_signal"]
-            st.session_state.df_signal["仓位"] = 0  # 0=空仓，1=满仓
-            st.session_state.df_signal["每日收益%"] = 0.0
-            st.session_state.df_signal["累计收益倍数"] = 1.0
-            st.session_state.df_signal["资金余额"] = st.session_state.initial_capital
-            st.session_state.df_signal["持仓数量"] = 0
-            st.session_state.df_signal["持仓价值"] = 0
-
-            # 执行回测逻辑
-            for i in range(1, len(st.session_state.df_signal)):
-                prev = st.session_state.df_signal.iloc[i - 1]
-                curr = st.session_state.df_signal.iloc[i]
-                curr_idx = st.session_state.df_signal.index[i]
-                close_price = curr["收盘"]
-
-                # 更新仓位
-                if prev["仓位"] == 0:
-                    # 空仓状态
-                    if curr["买卖信号"] == 1:
-                        # 全仓买入
-                        position = int(prev["资金余额"] / close_price)
-                        st.session_state.df_signal.at[curr_idx, "仓位"] = 1
-                        st.session_state.df_signal.at[curr_idx, "持仓数量"] = position
-                        st.session_state.df_signal.at[curr_idx, "持仓价值"] = position * close_price
-                        st.session_state.df_signal.at[curr_idx, "资金余额"] = prev["资金余额"] - (position * close_price)
-                    else:
-                        # 保持空仓
-                        st.session_state.df_signal.at[curr_idx, "仓位"] = 0
-                        st.session_state.df_signal.at[curr_idx, "持仓数量"] = 0
-                        st.session_state.df_signal.at[curr_idx, "持仓价值"] = 0
-                        st.session_state.df_signal.at[curr_idx, "资金余额"] = prev["资金余额"]
-                else:
-                    # 满仓状态
-                    if curr["买卖信号"] == -1:
-                        # 清仓卖出
-                        st.session_state.df_signal.at[curr_idx, "仓位"] = 0
-                        st.session_state.df_signal.at[curr_idx, "资金余额"] = prev["资金余额"] + (prev["持仓数量"] * close_price)
-                        st.session_state.df_signal.at[curr_idx, "持仓数量"] = 0
-                        st.session_state.df_signal.at[curr_idx, "持仓价值"] = 0
-                    else:
-                        # 保持持仓
-                        st.session_state.df_signal.at[curr_idx, "仓位"] = 1
-                        st.session_state.df_signal.at[curr_idx, "持仓数量"] = prev["持仓数量"]
-                        st.session_state.df_signal.at[curr_idx, "持仓价值"] = prev["持仓数量"] * close_price
-                        st.session_state.df_signal.at[curr_idx, "资金余额"] = prev["资金余额"]
-
-                # 计算收益指标
-                total_asset_prev = prev["资金余额"] + prev["持仓价值"]
-                total_asset_curr = st.session_state.df_signal.at[curr_idx, "资金余额"] + st.session_state.df_signal.at[curr_idx, "持仓价值"]
-                daily_return = (
-                                           total_asset_curr - total_asset_prev) / total_asset_prev * 100 if total_asset_prev > 0 else 0
-                st.session_state.df_signal.at[curr_idx, "每日收益%"] = round(daily_return, 2)
-                st.session_state.df_signal.at[curr_idx, "累计收益倍数"] = round(
-                    prev["累计收益倍数"] * (1 + daily_return / 100), 4
-                )
-
-            # 计算核心回测指标
-            final_asset = st.session_state.df_signal["资金余额"].iloc[-1] + st.session_state.df_signal["持仓价值"].iloc[-1]
-            total_return = (final_asset - st.session_state.initial_capital) / st.session_state.initial_capital * 100
-            max_dd = calculate_max_drawdown(df["累计收益倍数"])
-            win_rate = calculate_win_rate(st.session_state.df_signal)
-            signal_counts = st.session_state.df_signal["买卖信号"].value_counts().sort_index()
-            buy_cnt = signal_counts.get(1, 0)
-            sell_cnt = signal_counts.get(-1, 0)
-
-            st.session_state.backtest_result = {
-                "总收益率(%)": round(total_return, 2),
-                "最大回撤(%)": max_dd,
-                "胜率(%)": win_rate,
-                "买入信号": buy_cnt,
-                "卖出信号": sell_cnt,
-                "完整交易": min(buy_cnt, sell_cnt),
-                "初始资金(元)": st.session_state.initial_capital,
-                "最终资产(元)": round(final_asset, 2)
-            }
-
-            st.success("✅ 回测完成！")
-            with st.expander("查看回测数据样例（前5行）"):
-                st.dataframe(
-                    st.session_state.df_signal[["日期", "股票代码", "收盘", "pred_signal", "仓位", "资金余额", "累计收益倍数"]].head(),
-                    hide_index=True
-                )
+            # 回测在后台线程执行；参数、数据与模型版本相同时重新挂接到已有任务
+            paths = backtest.model_paths()
+            job_key = (f"{st.session_state.symbol}-{start_str}-{end_str}-"
+                       f"{st.session_state.initial_capital}-{data_fingerprint(st.session_state.stock_df)}-"
+                       f"{backtest.model_version(paths)}")
+            jobs.submit(job_key, backtest.run_pipeline,
+                        st.session_state.stock_df.copy(), st.session_state.initial_capital, paths=paths)
+            st.session_state.job_key = job_key
+            st.session_state.job_collected = False
+            # 清除上一次的结果，避免新任务运行时仍展示旧图表
+            st.session_state.df_signal = None
+            st.session_state.df = None
+            st.session_state.backtest_result = None
+            st.session_state.export_key = None
+
+        if st.session_state.job_key is not None:
+            show_job_progress()
 
         # 4. 结果可视化
         if st.session_state.backtest_result is not None and st.session_state.df is not None:
@@ -425,12 +328,134 @@ def show():
             ax4.set_title(f"Signal Distribution (Total Days: {len(df)})")
             st.pyplot(fig4)
 
+            # 图表5：蒙特卡洛稳健性分析
+            st.write("### 🎲 蒙特卡洛稳健性分析")
+            mc_col1, mc_col2, mc_col3 = st.columns(3)
+            with mc_col1:
+                mc_method = st.selectbox(
+                    "抽样方法",
+                    options=["block", "shuffle", "resample"],
+                    format_func={"block": "每日收益分块抽样", "shuffle": "交易顺序打乱",
+                                 "resample": "交易有放回抽样"}.get,
+                    key="mc_method"
+                )
+            with mc_col2:
+                mc_paths = st.number_input("模拟路径数", min_value=100, max_value=20000,
+                                           value=10000, step=1000, key="mc_paths")
+            with mc_col3:
+                mc_block = st.number_input("分块长度（天）", min_value=1, max_value=250,
+                                           value=20, step=5, key="mc_block",
+                                           disabled=mc_method != "block")
+
+            try:
+                mc_returns, periods_per_year = robustness.sample_returns(df, mc_method)
+                mc = monte_carlo(mc_returns, mc_method, int(mc_paths), int(mc_block), periods_per_year)
+                st.dataframe(mc["summary"], use_container_width=True)
+
+                fig5, ax5 = plt.subplots(figsize=(12, 6))
+                low, mid, high = mc["band"]
+                if mc_method == "block":
+                    x = df["日期"].iloc[1:]
+                    ax5.plot(df["日期"], df["累计收益倍数"], color="#ff7f0e", linewidth=2, label="Actual Strategy")
+                    ax5.set_xlabel("Date")
+                else:
+                    x = range(1, len(mid) + 1)
+                    ax5.set_xlabel("Trade #")
+                ax5.fill_between(x, low, high, color="#1f77b4", alpha=0.2, label="5%-95% Band")
+                ax5.plot(x, mid, color="#1f77b4", linewidth=1.5, linestyle="--", label="Median Path")
+
+                ax5.set_ylabel("Return Multiple (Initial=1)")
+                ax5.set_title(f"Monte Carlo Confidence Band ({int(mc_paths)} paths)")
+                ax5.legend()
+                ax5.grid(alpha=0.3)
+                plt.xticks(rotation=45)
+                st.pyplot(fig5)
+            except ValueError as e:
+                st.warning(f"无法进行稳健性分析：{str(e)}")
+
             # 交易详情表
             st.write("### 📋 交易信号详情")
-            signal_df = df[df["买卖信号"] != 0].copy()
-            signal_df["信号类型"] = signal_df["买卖信号"].map({1: "买入", -1: "卖出"})
-            st.dataframe(
-                signal_df[["日期", "股票代码", "收盘", "信号类型", "资金余额", "持仓价值"]],
-                use_container_width=True
-            )
+            trade_df = backtest.trade_details(df)
+            st.dataframe(trade_df, use_container_width=True)
+
+            # 导出回测结果（分块写出，内存占用与数据量无关）
+            st.write("### 💾 导出回测结果")
+            exp_col1, exp_col2 = st.columns([1, 2])
+            with exp_col1:
+                export_fmt = st.selectbox("导出格式", options=list(export.FORMATS),
+                                          format_func=export.FORMATS.get, key="export_fmt")
+            with exp_col2:
+                st.write("")
+                if st.button("📦 生成导出文件", use_container_width=True):
+                    # 导出在后台线程执行，写出大表时页面不会卡住；同一回测结果与格式重复点击时挂接到已有任务
+                    if "export_session" not in st.session_state:
+                        st.session_state.export_session = uuid.uuid4().hex
+                    export_key = f"export-{st.session_state.export_session}-{st.session_state.job_key}-{export_fmt}"
+                    jobs.submit(export_key, export.export_results, df, trade_df, result, export_fmt,
+                                directory=export.session_dir(
+                                    os.path.join(st.session_state.export_session, export_fmt)))
+                    st.session_state.export_key = export_key
+
+            export_job = jobs.get(st.session_state.export_key) if st.session_state.export_key else None
+            export_path = None
+            if export_job is not None and not export_job.finished and not export_job.cancelled:
+                poll_job(st.session_state.export_key)
+            elif export_job is not None and export_job.status == "failed":
+                st.error(f"导出失败：{export_job.error}")
+            elif export_job is not None and export_job.status == "done":
+                export_path = export_job.result
+            if export_path and os.path.exists(export_path):
+                with open(export_path, "rb") as f:
+                    st.download_button(
+                        "⬇️ 下载导出文件",
+                        data=f,
+                        file_name=os.path.basename(export_path),
+                        use_container_width=True
+                    )
+
+    # ---------------------- 6. 多策略对比 ----------------------
+    st.subheader("5. 多策略对比")
+    with st.container(border=True):
+        # 模型路径在本次运行内只解析一次，保证任务使用的模型与任务键中的版本一致
+        model_paths = backtest.model_paths()
+        all_strategies = {s.name: s for s in strategies.default_strategies(model_paths)}
+        selected = st.multiselect("选择策略", options=list(all_strategies), default=list(all_strategies))
+        compare_btn = st.button(
+            "⚖️ 开始对比",
+            type="primary",
+            use_container_width=True,
+            disabled=st.session_state.stock_df is None or not selected
+        )
 
+        if compare_btn:
+            # 所有策略共用一次特征计算，每个策略一次向量化回测
+            compare_key = (f"compare-{st.session_state.symbol}-{start_str}-{end_str}-"
+                           f"{st.session_state.initial_capital}-{data_fingerprint(st.session_state.stock_df)}-"
+                           f"{backtest.model_version(model_paths)}-{','.join(selected)}")
+            jobs.submit(compare_key, strategies.compare, st.session_state.stock_df,
+                        [all_strategies[name] for name in selected], st.session_state.initial_capital)
+            st.session_state.compare_key = compare_key
+
+        compare_job = jobs.get(st.session_state.compare_key) if st.session_state.compare_key else None
+        if compare_job is not None and not compare_job.finished and not compare_job.cancelled:
+            poll_job(st.session_state.compare_key)
+        elif compare_job is not None and compare_job.status == "failed":
+            st.error(f"对比失败：{compare_job.error}")
+        elif compare_job is not None and compare_job.status != "done":
+            st.warning("对比已取消")
+        elif compare_job is not None:
+            table, equity = compare_job.result
+            st.dataframe(table, use_container_width=True)
+
+            fig6, ax6 = plt.subplots(figsize=(12, 6))
+            for name in equity.columns.drop("日期"):
+                linestyle = "--" if name == "持有不动" else "-"
+                ax6.plot(equity["日期"], equity[name], linewidth=1.5, linestyle=linestyle, label=name)
+
+            ax6.set_xlabel("Date")
+            ax6.set_ylabel("Return Multiple (Initial=1)")
+            ax6.set_title("Strategy Comparison")
+            ax6.legend()
+            ax6.grid(alpha=0.3)
+            plt.xticks(rotation=45)
+            st.pyplot(fig6)
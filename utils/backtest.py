@@ -0,0 +1,211 @@
+import os
+import numpy as np
+from utils import feature_engineering, data_clean, predict_signal
+
+# 模型所需特征
+STATIC_FEATURES = ['开盘', '收盘', '最高', '最低', '成交量', '换手率',
+                   'MA_5', 'MA_20', 'MACD', 'MACD_Signal', 'RSI_14',
+                   'Volatility_20D', 'BB_Middle', 'ATR_14', 'OBV']
+
+TIME_FEATURES = ['收盘_5d_mean', '成交量_5d_mean', 'MACD_5d_mean', 'RSI_14_5d_mean',
+                 '最高_5d_max', '最低_5d_min', '股票代码']
+
+# 项目根目录（AKshare）
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODEL_PATHS = {
+    "static": os.path.join(PROJECT_ROOT, "model", "model1_static_lgb.pkl"),
+    "time": os.path.join(PROJECT_ROOT, "model", "model2_time_lgb.pkl"),
+    "meta": os.path.join(PROJECT_ROOT, "model", "meta_model_logistic.pkl"),
+    "encoder": os.path.join(PROJECT_ROOT, "model", "stock_encoder.pkl")
+}
+
+# 重训练生成的模型版本（见 utils/retrain.py），LATEST 文件记录当前使用的版本号
+VERSIONS_DIR = os.path.join(PROJECT_ROOT, "model", "versions")
+
+
+def model_paths(version=None):
+    """返回模型路径：指定版本 > LATEST 指向的版本 > model/ 下的初始模型"""
+    if version is None:
+        latest = os.path.join(VERSIONS_DIR, "LATEST")
+        if not os.path.exists(latest):
+            return MODEL_PATHS
+        with open(latest) as f:
+            version = f.read().strip()
+    version_dir = os.path.join(VERSIONS_DIR, version)
+    return {name: os.path.join(version_dir, os.path.basename(path)) for name, path in MODEL_PATHS.items()}
+
+
+def model_version(paths):
+    """模型路径对应的版本号，model/ 下的初始模型为 "base"（用于区分不同模型的回测结果）"""
+    version_dir = os.path.dirname(paths["static"])
+    if version_dir == os.path.dirname(MODEL_PATHS["static"]):
+        return "base"
+    return os.path.basename(version_dir)
+
+
+# 计算最大回撤（风险指标）
+def calculate_max_drawdown(return_series):
+    if len(return_series) < 2:
+        return 0.0
+    peak_series = return_series.cummax()  # 历史峰值
+    drawdown_series = (return_series - peak_series) / peak_series  # 每日回撤
+    return round(drawdown_series.min() * 100, 2)  # 最大回撤百分比
+
+
+# 计算策略胜率（盈利交易占比）
+def calculate_win_rate(signal_df):
+    signal_points = signal_df[signal_df["买卖信号"] != 0].copy()
+    if len(signal_points) < 2:
+        return 0.0
+
+    win_count = 0
+    total_trades = 0
+    buy_price = None
+
+    for _, row in signal_points.iterrows():
+        if row["买卖信号"] == 1:
+            buy_price = row["收盘"]
+        elif row["买卖信号"] == -1 and buy_price is not None:
+            total_trades += 1
+            if row["收盘"] > buy_price:
+                win_count += 1
+            buy_price = None
+
+    return round((win_count / total_trades) * 100, 2) if total_trades > 0 else 0.0
+
+
+def _noop(*args, **kwargs):
+    pass
+
+
+def simulate(df_signal, initial_capital, progress=_noop):
+    """按买卖信号逐日模拟全仓买入/全额清仓，结果写入 df_signal"""
+    signal = df_signal["买卖信号"].to_numpy()
+    close = df_signal["收盘"].to_numpy(dtype=float)
+    n = len(df_signal)
+
+    position = np.zeros(n, dtype=int)  # 0=空仓，1=满仓
+    shares = np.zeros(n, dtype=int)
+    holding = np.zeros(n)
+    cash = np.full(n, float(initial_capital))
+    daily = np.zeros(n)
+    cumulative = np.ones(n)
+
+    for i in range(1, n):
+        if position[i - 1] == 0:
+            # 空仓状态
+            if signal[i] == 1:
+                # 全仓买入
+                position[i] = 1
+                shares[i] = int(cash[i - 1] / close[i])
+                holding[i] = shares[i] * close[i]
+                cash[i] = cash[i - 1] - holding[i]
+            else:
+                # 保持空仓
+                cash[i] = cash[i - 1]
+        else:
+            # 满仓状态
+            if signal[i] == -1:
+                # 清仓卖出
+                cash[i] = cash[i - 1] + shares[i - 1] * close[i]
+            else:
+                # 保持持仓
+                position[i] = 1
+                shares[i] = shares[i - 1]
+                holding[i] = shares[i] * close[i]
+                cash[i] = cash[i - 1]
+
+        # 计算收益指标
+        asset_prev = cash[i - 1] + holding[i - 1]
+        asset_curr = cash[i] + holding[i]
+        daily[i] = round((asset_curr - asset_prev) / asset_prev * 100 if asset_prev > 0 else 0, 2)
+        cumulative[i] = round(cumulative[i - 1] * (1 + daily[i] / 100), 4)
+
+        if i % 500 == 0:
+            progress("执行回测", i / n)
+
+    df_signal["仓位"] = position
+    df_signal["持仓数量"] = shares
+    df_signal["持仓价值"] = holding
+    df_signal["资金余额"] = cash
+    df_signal["每日收益%"] = daily
+    df_signal["累计收益倍数"] = cumulative
+    return df_signal
+
+
+def summarize(df_signal, initial_capital):
+    """计算核心回测指标"""
+    final_asset = df_signal["资金余额"].iloc[-1] + df_signal["持仓价值"].iloc[-1]
+    total_return = (final_asset - initial_capital) / initial_capital * 100
+    signal_counts = df_signal["买卖信号"].value_counts().sort_index()
+    buy_cnt = signal_counts.get(1, 0)
+    sell_cnt = signal_counts.get(-1, 0)
+
+    return {
+        "总收益率(%)": round(total_return, 2),
+        "最大回撤(%)": calculate_max_drawdown(df_signal["累计收益倍数"]),
+        "胜率(%)": calculate_win_rate(df_signal),
+        "买入信号": buy_cnt,
+        "卖出信号": sell_cnt,
+        "完整交易": min(buy_cnt, sell_cnt),
+        "初始资金(元)": initial_capital,
+        "最终资产(元)": round(final_asset, 2)
+    }
+
+
+def trade_details(df_signal):
+    """交易信号详情表"""
+    signal_df = df_signal[df_signal["买卖信号"] != 0].copy()
+    signal_df["信号类型"] = signal_df["买卖信号"].map({1: "买入", -1: "卖出"})
+    return signal_df[["日期", "股票代码", "收盘", "信号类型", "资金余额", "持仓价值"]]
+
+
+def run_pipeline(stock_df, initial_capital, progress=_noop, paths=None):
+    """
+    完整回测流程：清洗 -> 特征工程 -> 标准化 -> 模型信号 -> 回测
+    progress(stage, fraction, message=None) 用于汇报进度，抛出异常即可中断流程
+    paths 为使用的模型路径（见 model_paths），默认取当前版本
+    返回 (df_signal, backtest_result)
+    """
+    # 步骤1：数据清洗
+    progress("数据清洗", 0.0)
+    df_clean = data_clean.clean1(stock_df)
+    # 至少需要覆盖特征预热期并留出一行有效数据
+    min_rows = feature_engineering.lookback(STATIC_FEATURES + TIME_FEATURES) + 1
+    if len(df_clean) < min_rows:
+        raise ValueError(f"数据不足{min_rows}条，无法计算模型特征")
+
+    # 步骤2：特征工程（只计算模型所需的指标）
+    progress("计算MACD指标", 0.0)
+    feature_df = feature_engineering.feature_engineering(df_clean, columns=STATIC_FEATURES + TIME_FEATURES)
+
+    # 步骤3：二次清洗（clean2 会原地标准化价格与指标并编码股票代码，先保留原始值用于回测、展示与导出）
+    progress("数据标准化", 0.0)
+    raw_df = feature_df.copy()
+    paths = paths or model_paths()
+    df = data_clean.clean2(feature_df, paths["encoder"])
+
+    # 验证必要列
+    required_cols = ["MACD", "MACD_Signal", "日期", "收盘"]
+    missing = [c for c in required_cols if c not in df.columns]
+    if missing:
+        raise ValueError(f"缺少必要列：{', '.join(missing)}")
+
+    # 步骤4：计算信号与收益
+    progress("模型预测", 0.0)
+    models = predict_signal.load_models(paths, verbose=False)
+    df_signal = predict_signal.predict_signal(
+        df, STATIC_FEATURES, TIME_FEATURES, models["static"], models["time"], models["meta"],
+        progress=lambda i, total, code: progress("模型预测", i / total, f"股票 {code} ({i}/{total})")
+    )
+
+    progress("执行回测", 0.0)
+    # 模型预测完成后还原为原始数值
+    raw_cols = [c for c in raw_df.columns if c in df_signal.columns]
+    df_signal[raw_cols] = raw_df.loc[df_signal.index, raw_cols]
+    df_signal["买卖信号"] = df_signal["pred_signal"]
+    simulate(df_signal, initial_capital, progress)
+    progress("执行回测", 1.0)
+
+    return df_signal, summarize(df_signal, initial_capital)
@@ -1,7 +1,6 @@
 import pandas as pd
 import os
 import joblib
-from sklearn.preprocessing import LabelEncoder
 
 #清洗获取实盘数据
 def clean1(df):
@@ -11,8 +10,12 @@ def clean1(df):
 
     return df
 
-# 清洗特征工程后的数据
-def clean2(df):
+# 默认股票编码器路径（重训练后的版本见 backtest.model_paths()["encoder"]）
+ENCODER_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "model", "stock_encoder.pkl")
+
+
+# 标准化特征工程后的数据（按股票分组）
+def normalize(df):
     df.bfill(inplace=True)
     df.drop_duplicates(keep='first', inplace=True)
 
@@ -21,18 +24,24 @@ def clean2(df):
     '换手率', 'MA_5', 'MA_20', 'MA_60', 'EMA_12', 'EMA_26', 'MACD',
     'MACD_Signal', 'MACD_Histogram', 'RSI_14', 'Daily_Return',
     'Volatility_20D', 'BB_Middle', 'BB_Upper', 'BB_Lower', 'ATR_14', 'OBV']
+    # 只标准化实际计算出的特征列（特征工程可按需只计算部分列）
+    features = [f for f in features if f in df.columns]
 
     df[features] = df.groupby('股票代码')[features].transform(
         lambda x: (x - x.mean()) / (x.std() + 1e-8)
     )
-    current_file = os.path.abspath(__file__)
-    # 获取 utils 目录
-    utils_dir = os.path.dirname(current_file)
-    # 获取项目根目录（AKshare）
-    project_root = os.path.dirname(utils_dir)
-    # 构建模型路径
-    model_path = os.path.join(project_root, "model", "stock_encoder.pkl")
-    le = joblib.load(model_path)
-    df['股票代码'] = le.fit_transform(df['股票代码'])
+    return df
 
+
+# 用训练时拟合的编码器对股票代码编码；训练集中未出现的股票编码为 -1
+def encode_stock_code(df, encoder):
+    mapping = {str(code): i for i, code in enumerate(encoder.classes_)}
+    df['股票代码'] = df['股票代码'].astype(str).map(mapping).fillna(-1).astype(int)
     return df
+
+
+# 清洗特征工程后的数据
+def clean2(df, encoder_path=ENCODER_PATH):
+    df = normalize(df)
+    le = joblib.load(encoder_path)
+    return encode_stock_code(df, le)
@@ -0,0 +1,175 @@
+import os
+import time
+import zipfile
+import tempfile
+import numpy as np
+import pandas as pd
+
+# 分块写出回测结果：每次只转换 CHUNK_SIZE 行，内存占用与总行数无关
+CHUNK_SIZE = 50000
+
+# Excel 单个工作表最多 1048576 行（含表头），超出的表拆分到多个工作表
+EXCEL_MAX_ROWS = 1048575
+
+# 页面导出目录：每个会话一个子目录，重复导出时覆盖上一次的文件
+EXPORT_ROOT = os.path.join(tempfile.gettempdir(), "backtest_exports")
+
+FORMATS = {
+    "csv": "CSV（.zip）",
+    "parquet": "Parquet（.zip）",
+    "xlsx": "Excel（.xlsx）"
+}
+
+
+def _noop(*args, **kwargs):
+    pass
+
+
+def iter_chunks(df, chunk_size=CHUNK_SIZE, progress=_noop):
+    """按行分块；每块写出前调用 progress(已完成比例)，抛出异常即可中断写出"""
+    for start in range(0, len(df), chunk_size):
+        progress(start / len(df))
+        yield df.iloc[start:start + chunk_size]
+
+
+def write_csv(df, path, chunk_size=CHUNK_SIZE, progress=_noop):
+    # utf-8-sig 保证 Excel 打开中文列名不乱码
+    with open(path, "w", encoding="utf-8-sig", newline="") as f:
+        df.iloc[:0].to_csv(f, index=False)
+        for chunk in iter_chunks(df, chunk_size, progress):
+            chunk.to_csv(f, index=False, header=False)
+
+
+def write_parquet(df, path, chunk_size=CHUNK_SIZE, progress=_noop):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("导出 Parquet 需要安装 pyarrow")
+
+    # object 列统一转为字符串类型，schema 由列类型决定而不是由数据推断（空表也能写出）
+    text_cols = [c for c in df.columns if df[c].dtype == object]
+    schema = pa.Schema.from_pandas(df.iloc[:0].astype({c: "string" for c in text_cols}), preserve_index=False)
+    with pq.ParquetWriter(path, schema) as writer:
+        for chunk in iter_chunks(df, chunk_size, progress):
+            chunk = chunk.astype({c: "string" for c in text_cols})
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+
+
+def excel_sheets(name, df, max_rows=EXCEL_MAX_ROWS):
+    """超过 max_rows 行的表拆分为 名称_1、名称_2 ... 多个工作表，返回 [(工作表名, DataFrame)]"""
+    if len(df) <= max_rows:
+        return [(name, df)]
+    return [(f"{name}_{i + 1}", df.iloc[start:start + max_rows])
+            for i, start in enumerate(range(0, len(df), max_rows))]
+
+
+def write_excel(sheets, path, chunk_size=CHUNK_SIZE, progress=_noop):
+    """sheets: {工作表名: DataFrame}；使用 openpyxl 只写模式逐行写出"""
+    from openpyxl import Workbook
+
+    parts = [part for name, df in sheets.items() for part in excel_sheets(name, df)]
+    total = max(sum(len(df) for _, df in parts), 1)
+    done = 0
+    wb = Workbook(write_only=True)
+    for name, df in parts:
+        ws = wb.create_sheet(title=name)
+        ws.append([str(c) for c in df.columns])
+        for chunk in iter_chunks(df, chunk_size, lambda f, n=len(df), d=done: progress((d + f * n) / total)):
+            # 缺失值写为空单元格
+            values = chunk.astype(object).where(chunk.notna(), None)
+            for row in values.itertuples(index=False, name=None):
+                ws.append(row)
+        done += len(df)
+    progress(1.0)
+    wb.save(path)
+
+
+def metrics_frame(metrics):
+    return pd.DataFrame({"指标": list(metrics.keys()), "数值": pd.Series(list(metrics.values()), dtype=float)})
+
+
+def session_dir(session_id):
+    directory = os.path.join(EXPORT_ROOT, session_id)
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+
+def export_results(df_signal, trade_df, metrics, fmt, directory=None, progress=_noop):
+    """
+    导出回测数据、交易详情与回测指标，返回生成的文件路径
+    csv/parquet 每张表一个文件并打包为 zip，xlsx 为一个工作簿（超过单表行数上限的表拆分为多个工作表）
+    directory 中上一次导出的文件会先被删除
+    progress(stage, fraction, message=None) 用于汇报进度，可直接传入 jobs.submit 提供的回调
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"不支持的导出格式: {fmt}")
+    directory = directory or tempfile.mkdtemp(prefix="backtest_export_")
+    for name in os.listdir(directory):
+        if name.startswith("回测结果"):
+            os.remove(os.path.join(directory, name))
+    tables = {
+        "回测数据": df_signal,
+        "交易详情": trade_df,
+        "回测指标": metrics_frame(metrics)
+    }
+
+    if fmt == "xlsx":
+        path = os.path.join(directory, "回测结果.xlsx")
+        write_excel(tables, path, progress=lambda f: progress("写出 Excel", f))
+        return path
+
+    writer = write_csv if fmt == "csv" else write_parquet
+    path = os.path.join(directory, f"回测结果_{fmt}.zip")
+    with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for name, df in tables.items():
+            file_path = os.path.join(directory, f"{name}.{fmt}")
+            writer(df, file_path, progress=lambda f, name=name: progress("写出文件", f, name))
+            progress("压缩文件", 1.0, name)
+            zf.write(file_path, arcname=f"{name}.{fmt}")
+            os.remove(file_path)
+    return path
+
+
+def benchmark(n_rows=200000, formats=("csv", "parquet", "xlsx"), chunk_size=CHUNK_SIZE):
+    """用模拟的回测数据测试各格式的写出速度（行/秒）"""
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({
+        "日期": pd.date_range("2000-01-01", periods=n_rows, freq="min"),
+        "股票代码": rng.integers(0, 100, n_rows),
+        "信号类型": rng.choice(np.array(["买入", "卖出", "无"], dtype=object), n_rows),
+        "收盘": rng.random(n_rows) * 100,
+        "买卖信号": rng.integers(-1, 2, n_rows),
+        "资金余额": rng.random(n_rows) * 1e5,
+        "累计收益倍数": 1 + rng.standard_normal(n_rows) / 100
+    })
+
+    writers = {
+        "csv": write_csv,
+        "parquet": write_parquet,
+        "xlsx": lambda d, p, c: write_excel({"回测数据": d}, p, c)
+    }
+    rows = []
+    with tempfile.TemporaryDirectory() as directory:
+        for fmt in formats:
+            path = os.path.join(directory, f"bench.{fmt}")
+            start = time.perf_counter()
+            try:
+                writers[fmt](df, path, chunk_size)
+            except ImportError as e:
+                rows.append({"格式": fmt, "行数": n_rows, "耗时(秒)": None, "行/秒": None, "说明": str(e)})
+                continue
+            elapsed = time.perf_counter() - start
+            rows.append({
+                "格式": fmt,
+                "行数": n_rows,
+                "耗时(秒)": round(elapsed, 3),
+                "行/秒": int(n_rows / elapsed),
+                "文件大小(MB)": round(os.path.getsize(path) / 1e6, 2)
+            })
+    return pd.DataFrame(rows)
+
+
+if __name__ == "__main__":
+    # python -m utils.export
+    print(benchmark().to_string(index=False))
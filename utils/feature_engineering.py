@@ -1,70 +1,208 @@
 import pandas as pd
 import numpy as np
 
-def feature_engineering(df):
-    # 计算不同周期的移动平均线
-    df['MA_5'] = df['收盘'].rolling(window=5).mean()  # 5日均线
-    df['MA_20'] = df['收盘'].rolling(window=20).mean()  # 20日均线
-    df['MA_60'] = df['收盘'].rolling(window=60).mean()  # 60日均线
-
-    # 计算指数移动平均线
-    df['EMA_12'] = df['收盘'].ewm(span=12, adjust=False).mean()  # 12日EMA
-    df['EMA_26'] = df['收盘'].ewm(span=26, adjust=False).mean()  # 26日EMA
-
-    # MACD (指数平滑异同移动平均线)
-    df['MACD'] = df['EMA_12'] - df['EMA_26']  # DIF线
-    df['MACD_Signal'] = df['MACD'].ewm(span=9, adjust=False).mean()  # DEA信号线
-    df['MACD_Histogram'] = df['MACD'] - df['MACD_Signal']  # MACD柱状图
-
-    # 计算价格变化
-    delta = df['收盘'].diff()
-
-    # 分离上涨和下跌
-    up = delta.clip(lower=0)
-    down = -1 * delta.clip(upper=0)
-
-    # 计算平均增益和平均损失 (通常使用14天周期)
-    period = 14
-    avg_gain = up.ewm(com=period - 1, adjust=False).mean()
-    avg_loss = down.ewm(com=period - 1, adjust=False).mean()
-
-    # 计算RSI
-    rs = avg_gain / avg_loss
-    df['RSI_14'] = 100 - (100 / (1 + rs))
-
-    # 计算日收益率
-    df['Daily_Return'] = df['收盘'].pct_change()
-
-    # 计算20日历史波动率（年化）
-    df['Volatility_20D'] = df['Daily_Return'].rolling(window=20).std() * np.sqrt(252)  # 252个交易日
-
-    # 计算中轨（20日MA）、上轨和下轨
-    window = 20
-    df['BB_Middle'] = df['收盘'].rolling(window=window).mean()
-    bb_std = df['收盘'].rolling(window=window).std()
-    df['BB_Upper'] = df['BB_Middle'] + (bb_std * 2)
-    df['BB_Lower'] = df['BB_Middle'] - (bb_std * 2)
-
-    # 计算TR（真实波幅）
-    high_low = df['最高'] - df['最低']
-    high_close = np.abs(df['最高'] - df['收盘'].shift())
-    low_close = np.abs(df['最低'] - df['收盘'].shift())
-    tr = pd.concat([high_low, high_close, low_close], axis=1).max(axis=1)
-
-    # 计算14日ATR
-    df['ATR_14'] = tr.rolling(window=14).mean()
-
-    # 计算OBV
-    obv = (np.sign(df['收盘'].diff()) * df['成交量']).fillna(0).cumsum()
-    df['OBV'] = obv
-
-    def add_time_features(group):
-        for col in ['收盘', '成交量', 'MACD', 'RSI_14']:
-            group[f'{col}_5d_mean'] = group[col].rolling(5, min_periods=1).mean()
-        group['最高_5d_max'] = group['最高'].rolling(5, min_periods=1).max()
-        group['最低_5d_min'] = group['最低'].rolling(5, min_periods=1).min()
-        return group
-
-    df = df.groupby('股票代码').apply(add_time_features).reset_index(drop=True)
-
-    return df
\ No newline at end of file
+
+# ---------------------- 滚动窗口内核（基于累加和，复杂度 O(n)，与窗口长度无关） ----------------------
+def _window_sum(x, window):
+    c = np.concatenate(([0.0], np.cumsum(x)))
+    lower = np.maximum(np.arange(1, len(x) + 1) - window, 0)
+    return c[1:] - c[lower]
+
+
+def _window_counts(x, window):
+    # 有效值（有限值）个数与窗口内 ±inf 个数；NaN 视为缺失，含 inf 的窗口结果为 NaN（与 pandas 一致）
+    finite = np.isfinite(x)
+    count = _window_sum(finite.astype(float), window)
+    n_inf = _window_sum(np.isinf(x).astype(float), window)
+    return finite, count, n_inf
+
+
+def rolling_mean(x, window, min_periods=None):
+    """等价于 Series.rolling(window, min_periods).mean()（含 NaN/inf 输入）"""
+    x = np.asarray(x, dtype=float)
+    min_periods = window if min_periods is None else min_periods
+    finite, count, n_inf = _window_counts(x, window)
+    total = _window_sum(np.where(finite, x, 0.0), window)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        out = total / count
+    out[(count < max(min_periods, 1)) | (n_inf > 0)] = np.nan
+    return out
+
+
+def rolling_std(x, window, min_periods=None):
+    """等价于 Series.rolling(window, min_periods).std()（ddof=1，含 NaN/inf 输入）"""
+    x = np.asarray(x, dtype=float)
+    min_periods = window if min_periods is None else min_periods
+    finite, count, n_inf = _window_counts(x, window)
+    # 先按有限值的均值去中心化，减小平方和相减带来的精度损失
+    centered = np.where(finite, x - (x[finite].mean() if finite.any() else 0.0), 0.0)
+    total = _window_sum(centered, window)
+    total_sq = _window_sum(centered ** 2, window)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        var = (total_sq - total ** 2 / count) / (count - 1)
+    out = np.sqrt(np.clip(var, 0, None))
+    out[(count < max(min_periods, 2)) | (n_inf > 0)] = np.nan
+    return out
+
+
+def check_kernels(n=200, seed=0):
+    """用含 NaN/inf 的随机序列校验滚动内核与 pandas rolling 的结果一致"""
+    rng = np.random.default_rng(seed)
+    x = rng.standard_normal(n) * 10 + 100
+    x[rng.choice(n, 5, replace=False)] = np.nan
+    x[rng.choice(n, 2, replace=False)] = np.inf
+    x[rng.choice(n, 1)] = -np.inf
+    s = pd.Series(x)
+    for window in (1, 5, 20, 60):
+        for min_periods in (None, 1, 3):
+            if min_periods is not None and min_periods > window:
+                continue
+            expected = s.rolling(window, min_periods=min_periods)
+            np.testing.assert_allclose(rolling_mean(x, window, min_periods), expected.mean(),
+                                       rtol=1e-9, atol=1e-9, equal_nan=True)
+            np.testing.assert_allclose(rolling_std(x, window, min_periods), expected.std(),
+                                       rtol=1e-6, atol=1e-9, equal_nan=True)
+
+
+# ---------------------- 特征注册表 ----------------------
+# name -> {"inputs": 依赖的原始列或其他特征, "func": 计算函数, "window": 计算窗口（无窗口为 1）}
+# 以 "_" 开头的为共享中间量，只参与计算，不写入结果
+FEATURES = {}
+
+
+def register(name, inputs, func, window=1):
+    FEATURES[name] = {"inputs": tuple(inputs), "func": func, "window": window}
+
+
+def _sma(window, min_periods=None):
+    return lambda s: pd.Series(rolling_mean(s, window, min_periods), index=s.index)
+
+
+def _ema(span):
+    return lambda s: s.ewm(span=span, adjust=False).mean()
+
+
+def _grouped_sma(window):
+    # 按股票分组计算，避免不同股票的数据混在同一个窗口里
+    return lambda s, code: s.groupby(code).transform(_sma(window, min_periods=1))
+
+
+# 移动平均线
+register("MA_5", ["收盘"], _sma(5), window=5)
+register("MA_20", ["收盘"], _sma(20), window=20)
+register("MA_60", ["收盘"], _sma(60), window=60)
+
+# 指数移动平均线与MACD
+register("EMA_12", ["收盘"], _ema(12), window=12)
+register("EMA_26", ["收盘"], _ema(26), window=26)
+register("MACD", ["EMA_12", "EMA_26"], lambda fast, slow: fast - slow)
+register("MACD_Signal", ["MACD"], _ema(9), window=9)
+register("MACD_Histogram", ["MACD", "MACD_Signal"], lambda macd, signal: macd - signal)
+
+# RSI（14日）
+register("_delta", ["收盘"], lambda s: s.diff(), window=2)
+register("_avg_gain", ["_delta"], lambda d: d.clip(lower=0).ewm(com=13, adjust=False).mean(), window=14)
+register("_avg_loss", ["_delta"], lambda d: (-1 * d.clip(upper=0)).ewm(com=13, adjust=False).mean(), window=14)
+register("RSI_14", ["_avg_gain", "_avg_loss"], lambda gain, loss: 100 - (100 / (1 + gain / loss)))
+
+# 日收益率与20日年化波动率
+register("Daily_Return", ["收盘"], lambda s: s.pct_change(), window=2)
+register("Volatility_20D", ["Daily_Return"],
+         lambda r: pd.Series(rolling_std(r, 20), index=r.index) * np.sqrt(252), window=20)
+
+# 布林带（中轨即20日均线）
+register("_bb_std", ["收盘"], lambda s: pd.Series(rolling_std(s, 20), index=s.index), window=20)
+register("BB_Middle", ["MA_20"], lambda ma: ma)
+register("BB_Upper", ["BB_Middle", "_bb_std"], lambda mid, std: mid + std * 2)
+register("BB_Lower", ["BB_Middle", "_bb_std"], lambda mid, std: mid - std * 2)
+
+# 真实波幅与14日ATR
+register("_prev_close", ["收盘"], lambda s: s.shift(), window=2)
+register("_tr", ["最高", "最低", "_prev_close"],
+         lambda high, low, prev: pd.Series(
+             np.fmax.reduce([high - low, np.abs(high - prev), np.abs(low - prev)]), index=high.index))
+register("ATR_14", ["_tr"], _sma(14), window=14)
+
+# OBV
+register("OBV", ["_delta", "成交量"], lambda d, vol: (np.sign(d) * vol).fillna(0).cumsum())
+
+# 时序特征（按股票分组的5日窗口）
+for _col in ["收盘", "成交量", "MACD", "RSI_14"]:
+    register(f"{_col}_5d_mean", [_col, "股票代码"], _grouped_sma(5), window=5)
+register("最高_5d_max", ["最高", "股票代码"],
+         lambda s, code: s.groupby(code).transform(lambda x: x.rolling(5, min_periods=1).max()), window=5)
+register("最低_5d_min", ["最低", "股票代码"],
+         lambda s, code: s.groupby(code).transform(lambda x: x.rolling(5, min_periods=1).min()), window=5)
+
+# 全部对外输出的特征列（按注册顺序）
+ALL_FEATURES = [name for name in FEATURES if not name.startswith("_")]
+
+
+def resolve(columns, available=()):
+    """按依赖关系解析出计算 columns 所需的最小特征子图（拓扑序）"""
+    order, visiting = [], set()
+
+    def visit(name):
+        if name in order or (name in available and name not in FEATURES):
+            return
+        if name not in FEATURES:
+            raise KeyError(f"未知特征: {name}")
+        if name in visiting:
+            raise ValueError(f"特征存在循环依赖: {name}")
+        visiting.add(name)
+        for dep in FEATURES[name]["inputs"]:
+            visit(dep)
+        visiting.discard(name)
+        order.append(name)
+
+    for col in columns:
+        visit(col)
+    return order
+
+
+def lookback(columns):
+    """
+    计算 columns 所需的预热行数：沿依赖链累加各特征的 (window - 1)，取最长的一条
+    前 lookback 行的特征值不完整（NaN 或 EMA 尚未收敛）；未注册的列视为原始列
+    """
+    memo = {}
+
+    def rows(name):
+        if name not in FEATURES:
+            return 0
+        if name not in memo:
+            spec = FEATURES[name]
+            memo[name] = spec["window"] - 1 + max((rows(dep) for dep in spec["inputs"]), default=0)
+        return memo[name]
+
+    return max((rows(c) for c in columns), default=0)
+
+
+def feature_engineering(df, columns=None):
+    """
+    计算特征列；columns 为需要输出的列（已注册特征或 df 中已有的列），默认为全部特征
+    只计算 columns 依赖的子图，共享的中间量（EMA、差分、真实波幅等）只计算一次
+    columns 中既未注册也不在 df 中的列名会抛出 KeyError
+    """
+    columns = ALL_FEATURES if columns is None else list(columns)
+
+    computed = {}
+    for name in resolve(columns, available=df.columns):
+        spec = FEATURES[name]
+        args = [computed[dep] if dep in computed else df[dep] for dep in spec["inputs"]]
+        computed[name] = spec["func"](*args)
+
+    for name in ALL_FEATURES:
+        if name in columns:
+            df[name] = computed[name]
+
+    # 与按股票分组拼接后的行顺序保持一致
+    if "股票代码" in df.columns:
+        df = df.sort_values("股票代码", kind="stable")
+    return df.reset_index(drop=True)
+
+
+if __name__ == "__main__":
+    # python -m utils.feature_engineering
+    check_kernels()
+    print("滚动内核与 pandas rolling 结果一致")
@@ -0,0 +1,119 @@
+import os
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# 后台任务：在线程池中运行回测等耗时流程，脱离 Streamlit 脚本线程
+# 模块级状态在页面重新运行时保持不变，因此重新运行可以重新挂接到已有任务
+
+MAX_WORKERS = min(4, os.cpu_count() or 1)
+MAX_FINISHED_JOBS = 20  # 最多保留的已结束任务数
+
+_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="job")
+_jobs = {}
+_lock = threading.Lock()
+
+
+class JobCancelled(Exception):
+    """任务被用户取消"""
+
+
+class Job:
+    def __init__(self, key, func, args, kwargs):
+        self.key = key
+        self.id = uuid.uuid4().hex[:8]
+        self.status = "pending"  # pending / running / done / failed / cancelled
+        self.stage = "排队中"
+        self.progress = 0.0
+        self.message = None
+        self.result = None
+        self.error = None
+        self.traceback = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self._func = func
+        self._args = args
+        self._kwargs = kwargs
+        self._cancel = threading.Event()
+
+    @property
+    def finished(self):
+        return self.status in ("done", "failed", "cancelled")
+
+    @property
+    def cancelled(self):
+        """已请求取消且不会产生结果（工作线程可能尚未退出）"""
+        return self._cancel.is_set() and self.status != "done"
+
+    def report(self, stage, fraction=None, message=None):
+        """汇报进度；若任务已被取消则抛出 JobCancelled 以中断流程"""
+        if self._cancel.is_set():
+            raise JobCancelled()
+        self.stage = stage
+        if fraction is not None:
+            self.progress = min(max(float(fraction), 0.0), 1.0)
+        self.message = message
+
+    def cancel(self):
+        self._cancel.set()
+
+    def _run(self):
+        if self._cancel.is_set():
+            self.status = "cancelled"
+            self.finished_at = time.time()
+            return
+        self.status = "running"
+        try:
+            self.result = self._func(*self._args, progress=self.report, **self._kwargs)
+            self.status = "done"
+        except JobCancelled:
+            self.status = "cancelled"
+        except Exception as e:
+            self.error = str(e)
+            self.traceback = traceback.format_exc()
+            self.status = "failed"
+        finally:
+            self.finished_at = time.time()
+            # 释放输入数据
+            self._args = self._kwargs = None
+
+
+def submit(key, func, *args, **kwargs):
+    """
+    提交任务；func 需接受 progress 关键字参数
+    key 相同且任务仍在运行或已成功完成时，直接返回已有任务而不重新计算；
+    已请求取消的任务视为已结束，由新任务替换
+    """
+    with _lock:
+        job = _jobs.get(key)
+        if job is not None and not job.cancelled and job.status in ("pending", "running", "done"):
+            return job
+        job = Job(key, func, args, kwargs)
+        _jobs[key] = job
+        _prune()
+    _executor.submit(job._run)
+    return job
+
+
+def get(key):
+    return _jobs.get(key)
+
+
+def cancel(key):
+    job = _jobs.get(key)
+    if job is not None:
+        job.cancel()
+    return job
+
+
+def remove(key):
+    with _lock:
+        return _jobs.pop(key, None)
+
+
+def _prune():
+    finished = sorted((j for j in _jobs.values() if j.finished), key=lambda j: j.finished_at)
+    for job in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+        _jobs.pop(job.key, None)
@@ -2,27 +2,31 @@ import joblib
 import streamlit as st
 import numpy as np
 import os
-def load_models(model_paths):
-    """加载模型并返回模型字典"""
+def load_models(model_paths, verbose=True):
+    """加载模型并返回模型字典（后台线程中调用时 verbose=False，避免访问页面）"""
     models = {}
     for name, path in model_paths.items():
         if not os.path.exists(path):
             raise FileNotFoundError(f"模型文件不存在: {path}")
         try:
             models[name] = joblib.load(path)
-            st.success(f"✅ 成功加载模型: {name}")
+            if verbose:
+                st.success(f"✅ 成功加载模型: {name}")
         except Exception as e:
             raise Exception(f"加载模型 {name} 失败: {str(e)}")
     return models
 
-def predict_signal(df, static_fea, time_fea, model1, model2, meta_model):
+def predict_signal(df, static_fea, time_fea, model1, model2, meta_model, progress=None):
     df['pred_signal'] = 0
-    for code, group in df.groupby('股票代码'):
+    groups = df.groupby('股票代码')
+    for i, (code, group) in enumerate(groups, start=1):
         X1 = group[static_fea + ['股票代码']]
         X2 = group[time_fea]
         probs1 = model1.predict_proba(X1)
         probs2 = model2.predict_proba(X2)
         meta_features = np.hstack([probs1, probs2])
         df.loc[group.index, 'pred_signal'] = meta_model.predict(meta_features)
+        if progress is not None:
+            progress(i, groups.ngroups, code)
 
-    return df
\ No newline at end of file
+    return df
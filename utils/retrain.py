@@ -0,0 +1,237 @@
+import os
+import json
+import time
+import hashlib
+import argparse
+from datetime import datetime
+import joblib
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+from sklearn.linear_model import LogisticRegression
+from sklearn.model_selection import KFold
+from sklearn.preprocessing import LabelEncoder
+from utils import feature_engineering, data_clean, backtest
+
+# 离线重训练：本地缓存行情 -> 特征 + 标签 -> 两个 LightGBM 基模型并行训练 -> 折外概率训练逻辑回归元模型
+# 用法：python -m utils.retrain --fetch --symbols 600000 000858 --start 20150101
+
+PRICE_DIR = os.path.join(backtest.PROJECT_ROOT, "data", "prices")  # 行情缓存：<股票代码>.csv
+FEATURE_DIR = os.path.join(backtest.PROJECT_ROOT, "data", "features")  # 特征矩阵缓存
+
+# 标签：未来 HORIZON 个交易日收益率超过 +THRESHOLD 为买入(1)，低于 -THRESHOLD 为卖出(-1)，否则为 0
+HORIZON = 5
+THRESHOLD = 0.02
+
+LGB_PARAMS = {
+    "n_estimators": 300,
+    "learning_rate": 0.05,
+    "num_leaves": 31,
+    "subsample": 0.8,
+    "subsample_freq": 1,
+    "colsample_bytree": 0.8,
+    "verbose": -1
+}
+
+
+# ---------------------- 行情缓存 ----------------------
+def fetch_prices(symbols, start_date, end_date):
+    """通过 AKshare 下载后复权日线并缓存到 data/prices"""
+    import akshare as ak
+
+    os.makedirs(PRICE_DIR, exist_ok=True)
+    for symbol in symbols:
+        raw_df = ak.stock_zh_a_hist(symbol=symbol, period="daily",
+                                    start_date=start_date, end_date=end_date, adjust="hfq")
+        if "date" in raw_df.columns:
+            raw_df.rename(columns={"date": "日期"}, inplace=True)
+        if "股票代码" not in raw_df.columns:
+            raw_df["股票代码"] = symbol
+        raw_df.to_csv(os.path.join(PRICE_DIR, f"{symbol}.csv"), index=False)
+        print(f"已缓存 {symbol}：{len(raw_df)} 条")
+
+
+def cached_symbols():
+    if not os.path.isdir(PRICE_DIR):
+        return []
+    return sorted(f[:-4] for f in os.listdir(PRICE_DIR) if f.endswith(".csv"))
+
+
+def load_prices(symbol):
+    df = pd.read_csv(os.path.join(PRICE_DIR, f"{symbol}.csv"), dtype={"股票代码": str})
+    return df.sort_values("日期").reset_index(drop=True)
+
+
+# ---------------------- 特征与标签 ----------------------
+def make_labels(close, horizon=HORIZON, threshold=THRESHOLD):
+    forward = close.shift(-horizon) / close - 1
+    labels = pd.Series(np.select([forward > threshold, forward < -threshold], [1, -1], 0), index=close.index)
+    return labels.where(forward.notna())
+
+
+def _cache_path(symbol, horizon, threshold):
+    # 行情文件或特征/标签定义变化时缓存自动失效
+    stat = os.stat(os.path.join(PRICE_DIR, f"{symbol}.csv"))
+    features = backtest.STATIC_FEATURES + backtest.TIME_FEATURES
+    key = f"v3-{stat.st_mtime_ns}-{stat.st_size}-{features}-{horizon}-{threshold}"
+    return os.path.join(FEATURE_DIR, f"{symbol}-{hashlib.sha1(key.encode()).hexdigest()[:12]}.pkl")
+
+
+def build_symbol_frame(symbol, horizon=HORIZON, threshold=THRESHOLD):
+    """
+    单只股票的特征矩阵（与回测页面相同的 clean1 -> feature_engineering -> 标准化流程）
+    标签基于标准化前的收盘价；股票代码保持原值，在 build_dataset 中统一编码；结果缓存到 data/features
+    """
+    path = _cache_path(symbol, horizon, threshold)
+    if os.path.exists(path):
+        return pd.read_pickle(path)
+
+    columns = backtest.STATIC_FEATURES + backtest.TIME_FEATURES
+    df = data_clean.clean1(load_prices(symbol))
+    df = feature_engineering.feature_engineering(df, columns=columns)
+    df["label"] = make_labels(df["收盘"], horizon, threshold)
+    # 按股票单独标准化，与回测时的预测流程一致
+    df = data_clean.normalize(df)
+    # 去掉特征预热期内不完整的行与没有标签的行
+    df = df.iloc[feature_engineering.lookback(columns):]
+    df = df[df["label"].notna()]
+
+    os.makedirs(FEATURE_DIR, exist_ok=True)
+    df.to_pickle(path)
+    return df
+
+
+def build_dataset(symbols, horizon=HORIZON, threshold=THRESHOLD, n_jobs=-1):
+    """返回 (dataset, encoder)；股票编码器在全部股票上拟合一次，随模型版本一起保存"""
+    frames = Parallel(n_jobs=n_jobs)(
+        delayed(build_symbol_frame)(symbol, horizon, threshold) for symbol in symbols
+    )
+    dataset = pd.concat(frames, ignore_index=True)
+    # 按日期排序，交叉验证的各折为连续时间段
+    dataset = dataset.sort_values("日期", kind="stable").reset_index(drop=True)
+    dataset["label"] = dataset["label"].astype(int)
+
+    encoder = LabelEncoder().fit(dataset["股票代码"].astype(str))
+    dataset = data_clean.encode_stock_code(dataset, encoder)
+    return dataset, encoder
+
+
+# ---------------------- 训练 ----------------------
+def _fit(X, y, train_idx, test_idx, classes, n_threads):
+    from lightgbm import LGBMClassifier
+
+    model = LGBMClassifier(**LGB_PARAMS, n_jobs=n_threads)
+    model.fit(X.iloc[train_idx], y[train_idx])
+    if test_idx is None:
+        return model, None
+    # 某折缺少部分类别时，按完整类别补齐概率列
+    probs = np.zeros((len(test_idx), len(classes)))
+    probs[:, np.searchsorted(classes, model.classes_)] = model.predict_proba(X.iloc[test_idx])
+    return model, probs
+
+
+def train(dataset, n_splits=5, n_jobs=-1):
+    """
+    两个基模型的各折与全量训练任务一起并行（LightGBM 训练时释放 GIL，线程间共享数据无需复制）
+    返回 (models, metrics)
+    """
+    X1 = dataset[backtest.STATIC_FEATURES + ["股票代码"]]
+    X2 = dataset[backtest.TIME_FEATURES]
+    y = dataset["label"].to_numpy()
+    classes = np.unique(y)
+
+    folds = list(KFold(n_splits=n_splits, shuffle=False).split(X1))
+    tasks = [(name, X, train_idx, test_idx)
+             for name, X in (("static", X1), ("time", X2))
+             for train_idx, test_idx in folds + [(np.arange(len(y)), None)]]
+
+    n_cpu = os.cpu_count() or 1
+    n_workers = min(len(tasks), n_cpu if n_jobs == -1 else n_jobs)
+    n_threads = max(1, n_cpu // n_workers)
+    results = Parallel(n_jobs=n_workers, backend="threading")(
+        delayed(_fit)(X, y, train_idx, test_idx, classes, n_threads)
+        for _, X, train_idx, test_idx in tasks
+    )
+
+    models = {}
+    oof = {"static": np.zeros((len(y), len(classes))), "time": np.zeros((len(y), len(classes)))}
+    for (name, _, _, test_idx), (model, probs) in zip(tasks, results):
+        if test_idx is None:
+            models[name] = model
+        else:
+            oof[name][test_idx] = probs
+
+    # 元模型使用折外概率训练，避免基模型在训练集上的过拟合传递给元模型
+    meta_features = np.hstack([oof["static"], oof["time"]])
+    models["meta"] = LogisticRegression(max_iter=1000).fit(meta_features, y)
+
+    metrics = {
+        "样本数": int(len(y)),
+        "标签分布": {str(c): int((y == c).sum()) for c in classes},
+        "静态模型折外准确率": round(float((classes[oof["static"].argmax(1)] == y).mean()), 4),
+        "时序模型折外准确率": round(float((classes[oof["time"].argmax(1)] == y).mean()), 4),
+        # 元模型在同一份折外概率上训练与评估，为样本内准确率
+        "元模型样本内准确率": round(float((models["meta"].predict(meta_features) == y).mean()), 4)
+    }
+    return models, metrics
+
+
+# ---------------------- 版本化保存 ----------------------
+def save_artifacts(models, encoder, symbols, metrics, params, promote=True):
+    """保存到 model/versions/<版本号>/，promote=True 时更新 LATEST 使回测页面使用新模型"""
+    version = datetime.now().strftime("%Y%m%d-%H%M%S")
+    version_dir = os.path.join(backtest.VERSIONS_DIR, version)
+    os.makedirs(version_dir, exist_ok=True)
+
+    joblib.dump(models["static"], os.path.join(version_dir, "model1_static_lgb.pkl"))
+    joblib.dump(models["time"], os.path.join(version_dir, "model2_time_lgb.pkl"))
+    joblib.dump(models["meta"], os.path.join(version_dir, "meta_model_logistic.pkl"))
+    joblib.dump(encoder, os.path.join(version_dir, "stock_encoder.pkl"))
+
+    with open(os.path.join(version_dir, "metadata.json"), "w", encoding="utf-8") as f:
+        json.dump({"version": version, "symbols": list(symbols), "params": params, "metrics": metrics},
+                  f, ensure_ascii=False, indent=2)
+
+    if promote:
+        with open(os.path.join(backtest.VERSIONS_DIR, "LATEST"), "w") as f:
+            f.write(version)
+    return version_dir
+
+
+def main():
+    parser = argparse.ArgumentParser(description="离线重训练 LightGBM + 逻辑回归堆叠模型")
+    parser.add_argument("--symbols", nargs="*", help="股票代码，默认使用 data/prices 下全部缓存")
+    parser.add_argument("--fetch", action="store_true", help="训练前通过 AKshare 下载/更新行情缓存")
+    parser.add_argument("--start", default="20150101", help="下载开始日期")
+    parser.add_argument("--end", default=datetime.now().strftime("%Y%m%d"), help="下载结束日期")
+    parser.add_argument("--horizon", type=int, default=HORIZON)
+    parser.add_argument("--threshold", type=float, default=THRESHOLD)
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--jobs", type=int, default=-1)
+    parser.add_argument("--no-promote", action="store_true", help="只保存版本，不切换页面使用的模型")
+    args = parser.parse_args()
+
+    if args.fetch:
+        if not args.symbols:
+            parser.error("--fetch 需要同时指定 --symbols")
+        fetch_prices(args.symbols, args.start, args.end)
+
+    symbols = args.symbols or cached_symbols()
+    if not symbols:
+        parser.error("data/prices 下没有行情缓存，请使用 --fetch 下载")
+
+    start = time.perf_counter()
+    dataset, encoder = build_dataset(symbols, args.horizon, args.threshold, args.jobs)
+    print(f"特征构建完成：{len(dataset)} 条，{time.perf_counter() - start:.1f} 秒")
+
+    models, metrics = train(dataset, args.folds, args.jobs)
+    print(f"训练完成：{time.perf_counter() - start:.1f} 秒")
+    print(json.dumps(metrics, ensure_ascii=False, indent=2))
+
+    params = {"horizon": args.horizon, "threshold": args.threshold, "folds": args.folds, "lgb": LGB_PARAMS}
+    version_dir = save_artifacts(models, encoder, symbols, metrics, params, promote=not args.no_promote)
+    print(f"模型已保存：{version_dir}")
+
+
+if __name__ == "__main__":
+    main()
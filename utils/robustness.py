@@ -0,0 +1,135 @@
+import numpy as np
+import pandas as pd
+
+TRADING_DAYS = 252
+
+
+# 从回测结果中提取每日收益率（小数形式）
+def daily_returns_from_signal(signal_df):
+    return signal_df["每日收益%"].to_numpy(dtype=float)[1:] / 100
+
+
+# 从买卖信号中提取每笔完整交易的收益率（买入到卖出，按收盘价）
+def trade_returns_from_signal(signal_df):
+    signal = signal_df["买卖信号"].to_numpy()
+    close = signal_df["收盘"].to_numpy(dtype=float)
+
+    trade_returns = []
+    buy_price = None
+    for i in np.flatnonzero(signal != 0):
+        if signal[i] == 1 and buy_price is None:
+            buy_price = close[i]
+        elif signal[i] == -1 and buy_price is not None:
+            trade_returns.append(close[i] / buy_price - 1)
+            buy_price = None
+    return np.asarray(trade_returns, dtype=float)
+
+
+# 每次抽样/计算的路径数：中间矩阵（索引、收益、峰值）只按块分配，内存与总路径数无关
+CHUNK_PATHS = 1000
+
+
+def block_bootstrap(returns, n_paths=10000, block_size=20, seed=None):
+    """分块自助抽样：保留 block_size 长度内的序列相关性，返回 (n_paths, n) 的收益矩阵"""
+    returns = np.asarray(returns, dtype=np.float32)
+    n = len(returns)
+    if n == 0:
+        return np.empty((n_paths, 0), dtype=np.float32)
+    block_size = max(1, min(int(block_size), n))
+    rng = np.random.default_rng(seed)
+
+    n_blocks = -(-n // block_size)
+    starts = rng.integers(0, n - block_size + 1, size=(n_paths, n_blocks), dtype=np.int32)
+    idx = (starts[:, :, None] + np.arange(block_size, dtype=np.int32)).reshape(n_paths, -1)[:, :n]
+    return returns[idx]
+
+
+def shuffle_trades(trade_returns, n_paths=10000, replace=False, seed=None):
+    """交易顺序重排：replace=False 为打乱顺序，replace=True 为有放回抽样"""
+    trade_returns = np.asarray(trade_returns, dtype=np.float32)
+    n = len(trade_returns)
+    rng = np.random.default_rng(seed)
+    if replace:
+        return trade_returns[rng.integers(0, n, size=(n_paths, n), dtype=np.int32)]
+    return rng.permuted(np.broadcast_to(trade_returns, (n_paths, n)), axis=1)
+
+
+def path_metrics(paths, periods_per_year=TRADING_DAYS):
+    """对一组路径一次性计算净值曲线、总收益率、最大回撤与夏普比率"""
+    paths = np.asarray(paths, dtype=np.float32)
+    equity = np.cumprod(1 + paths, axis=1)
+    if equity.shape[1] == 0:
+        zeros = np.zeros(len(paths))
+        return {"equity": equity, "total_return": zeros, "max_drawdown": zeros, "sharpe": zeros}
+
+    # 峰值包含初始净值 1
+    peak = np.maximum(np.maximum.accumulate(equity, axis=1), 1.0)
+    max_drawdown = ((equity - peak) / peak).min(axis=1)
+
+    std = paths.std(axis=1, dtype=np.float64)
+    mean = paths.mean(axis=1, dtype=np.float64)
+    sharpe = np.divide(mean, std, out=np.zeros_like(mean), where=std > 0) * np.sqrt(periods_per_year)
+
+    return {
+        "equity": equity,
+        "total_return": equity[:, -1] - 1,
+        "max_drawdown": max_drawdown,
+        "sharpe": sharpe,
+    }
+
+
+def sample_returns(signal_df, method="block"):
+    """按抽样方法取出待重抽样的收益序列，返回 (returns, periods_per_year)"""
+    if method == "block":
+        return daily_returns_from_signal(signal_df), TRADING_DAYS
+    if method in ("shuffle", "resample"):
+        returns = trade_returns_from_signal(signal_df)
+        # 按平均每年交易次数年化
+        years = max(len(signal_df) / TRADING_DAYS, 1e-8)
+        return returns, max(len(returns) / years, 1.0)
+    raise ValueError(f"未知的抽样方法: {method}")
+
+
+def run_monte_carlo(returns, method="block", n_paths=10000, block_size=20, periods_per_year=TRADING_DAYS,
+                    quantiles=(0.05, 0.5, 0.95), seed=None):
+    """
+    对收益序列做蒙特卡洛稳健性分析（收益序列由 sample_returns 取得）
+    method: "block"   - 每日收益分块自助抽样
+            "shuffle" - 交易顺序打乱
+            "resample"- 交易有放回抽样
+    返回 {"summary": 分位数表, "band": 净值置信带, "metrics": 各路径指标}
+    """
+    if method not in ("block", "shuffle", "resample"):
+        raise ValueError(f"未知的抽样方法: {method}")
+    returns = np.asarray(returns, dtype=np.float32)
+    n = len(returns)
+    if n < 2:
+        raise ValueError("收益样本不足，无法进行稳健性分析")
+
+    rng = np.random.default_rng(seed)
+    equity = np.empty((n_paths, n), dtype=np.float32)
+    metrics = {key: np.empty(n_paths) for key in ("total_return", "max_drawdown", "sharpe")}
+    for start in range(0, n_paths, CHUNK_PATHS):
+        size = min(CHUNK_PATHS, n_paths - start)
+        if method == "block":
+            paths = block_bootstrap(returns, size, block_size, rng)
+        else:
+            paths = shuffle_trades(returns, size, replace=(method == "resample"), seed=rng)
+        chunk = path_metrics(paths, periods_per_year)
+        equity[start:start + size] = chunk["equity"]
+        for key in metrics:
+            metrics[key][start:start + size] = chunk[key]
+
+    q = np.asarray(quantiles)
+    summary = pd.DataFrame(
+        {
+            "总收益率(%)": np.quantile(metrics["total_return"], q) * 100,
+            "最大回撤(%)": np.quantile(metrics["max_drawdown"], q) * 100,
+            "夏普比率": np.quantile(metrics["sharpe"], q),
+        },
+        index=[f"P{round(x * 100)}" for x in q],
+    ).round(2)
+
+    # 就地求分位数，不再复制整张净值矩阵；只返回置信带，不保留各路径净值
+    band = np.quantile(equity, q, axis=0, overwrite_input=True)
+    return {"summary": summary, "band": band, "metrics": metrics, "quantiles": q}
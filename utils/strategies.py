@@ -0,0 +1,166 @@
+from abc import ABC, abstractmethod
+import numpy as np
+import pandas as pd
+from utils import feature_engineering, data_clean, predict_signal, backtest
+
+# 策略接口：每个策略声明所需特征列，并对共享特征表输出买卖信号数组（1=买入，-1=卖出，0=无信号）
+# 多个策略共用一次特征计算，每个策略只做一次向量化回测
+
+
+class Strategy(ABC):
+    name = "策略"
+    features = []
+
+    @abstractmethod
+    def signals(self, frame):
+        """返回与 frame 等长的信号数组"""
+
+
+def _noop(*args, **kwargs):
+    pass
+
+
+def _prev(frame, col):
+    # 按股票分组取前一日数值，避免跨股票比较
+    return frame.groupby("股票代码")[col].shift()
+
+
+class MACDCross(Strategy):
+    name = "MACD金叉/死叉"
+    features = ["MACD", "MACD_Signal"]
+
+    def signals(self, frame):
+        diff = frame["MACD"] - frame["MACD_Signal"]
+        prev = _prev(frame.assign(_diff=diff), "_diff")
+        return np.select([(prev <= 0) & (diff > 0), (prev >= 0) & (diff < 0)], [1, -1], 0)
+
+
+class RSIBand(Strategy):
+    features = ["RSI_14"]
+
+    def __init__(self, lower=30, upper=70):
+        self.lower = lower
+        self.upper = upper
+        self.name = f"RSI区间({lower}/{upper})"
+
+    def signals(self, frame):
+        rsi = frame["RSI_14"]
+        return np.select([rsi < self.lower, rsi > self.upper], [1, -1], 0)
+
+
+class BollingerBreakout(Strategy):
+    name = "布林带突破"
+    features = ["BB_Upper", "BB_Middle"]
+
+    def signals(self, frame):
+        close = frame["收盘"]
+        return np.select([close > frame["BB_Upper"], close < frame["BB_Middle"]], [1, -1], 0)
+
+
+class ModelStrategy(Strategy):
+    name = "LightGBM+逻辑回归模型"
+    features = backtest.STATIC_FEATURES + backtest.TIME_FEATURES
+
+    def __init__(self, model_paths=None):
+        self.model_paths = model_paths or backtest.model_paths()
+        self._models = None
+
+    def signals(self, frame):
+        if self._models is None:
+            self._models = predict_signal.load_models(self.model_paths, verbose=False)
+        # 模型使用标准化后的特征，在副本上处理，不影响其他策略使用的原始特征
+        df = data_clean.clean2(frame.copy(), self.model_paths["encoder"])
+        df = predict_signal.predict_signal(
+            df, backtest.STATIC_FEATURES, backtest.TIME_FEATURES,
+            self._models["static"], self._models["time"], self._models["meta"]
+        )
+        # clean2 会去重，按原索引对齐
+        return df["pred_signal"].reindex(frame.index, fill_value=0).to_numpy()
+
+
+def default_strategies(model_paths=None):
+    return [MACDCross(), RSIBand(), BollingerBreakout(), ModelStrategy(model_paths)]
+
+
+def simulate_vectorized(close, signal, initial_capital):
+    """
+    与 backtest.simulate 规则一致（全仓买入/全额清仓，首日信号忽略）的向量化回测
+    仓位由最近一次非零信号决定；只在每笔交易上循环计算整数股数，逐日数值全部为数组运算
+    返回 {"equity": 每日总资产, "position": 每日仓位, "entries": 买入位置, "exits": 卖出位置}
+    """
+    close = np.asarray(close, dtype=float)
+    signal = np.asarray(signal, dtype=float).copy()
+    n = len(close)
+    signal[:1] = 0
+
+    state = pd.Series(np.where(signal != 0, signal, np.nan)).ffill().fillna(-1).to_numpy()
+    position = (state == 1).astype(int)
+    change = np.diff(position, prepend=0)
+    entries = np.flatnonzero(change == 1)
+    exits = np.flatnonzero(change == -1)
+
+    shares = np.zeros(n)
+    cash = np.full(n, float(initial_capital))
+    level = float(initial_capital)
+    for k, entry in enumerate(entries):
+        exit_ = exits[k] if k < len(exits) else n
+        qty = int(level / close[entry])
+        level -= qty * close[entry]
+        shares[entry:exit_] = qty
+        cash[entry:exit_] = level
+        if exit_ < n:
+            level += qty * close[exit_]
+            cash[exit_:] = level
+
+    return {
+        "equity": cash + shares * close,
+        "position": position,
+        "entries": entries,
+        "exits": exits
+    }
+
+
+def strategy_metrics(close, sim, initial_capital):
+    equity = sim["equity"]
+    entries, exits = sim["entries"], sim["exits"]
+    close = np.asarray(close, dtype=float)
+
+    peak = np.maximum.accumulate(equity)
+    daily = np.diff(equity) / equity[:-1]
+    std = daily.std()
+    wins = close[exits] > close[entries[:len(exits)]]
+
+    return {
+        "总收益率(%)": round((equity[-1] / initial_capital - 1) * 100, 2),
+        "最大回撤(%)": round(((equity - peak) / peak).min() * 100, 2),
+        "夏普比率": round(daily.mean() / std * np.sqrt(252), 2) if std > 0 else 0.0,
+        "胜率(%)": round(wins.mean() * 100, 2) if len(wins) else 0.0,
+        "完整交易": len(exits),
+        "最终资产(元)": round(equity[-1], 2)
+    }
+
+
+def compare(stock_df, strategies, initial_capital, progress=_noop):
+    """
+    批量评估多个策略：特征只计算一次（各策略所需列的并集），每个策略一次向量化回测
+    返回 (指标对比表, 各策略每日净值表)
+    """
+    progress("数据清洗", 0.0)
+    df_clean = data_clean.clean1(stock_df.copy())
+
+    progress("计算特征", 0.0)
+    columns = list(dict.fromkeys(col for s in strategies for col in s.features))
+    frame = feature_engineering.feature_engineering(df_clean, columns=columns)
+    close = frame["收盘"].to_numpy(dtype=float)
+
+    rows = []
+    equity = pd.DataFrame({"日期": frame["日期"]})
+    for i, strategy in enumerate(strategies):
+        progress("策略回测", i / len(strategies), strategy.name)
+        sim = simulate_vectorized(close, strategy.signals(frame), initial_capital)
+        rows.append({"策略": strategy.name, **strategy_metrics(close, sim, initial_capital)})
+        equity[strategy.name] = sim["equity"] / initial_capital
+
+    equity["持有不动"] = close / close[0]
+    progress("策略回测", 1.0)
+    return pd.DataFrame(rows).set_index("策略"), equity